@@ -3,9 +3,10 @@ from tkinter import ttk, messagebox
 from PIL import Image, ImageTk
 import threading
 import cv2
+import numpy as np
 import queue
 import logging
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
 from camera_managers import CameraManager
 from face_recognition import FaceRecognitionSystem
 
@@ -24,6 +25,9 @@ DANGER = "#E74C3C"
 TEXT_LIGHT = "#FFFFFF"
 TEXT_DARK = "#2C3E50"
 
+# Цвет фона для OpenCV (кадры в RGB)
+DARK_BG_RGB = tuple(int(DARK_BG[i:i + 2], 16) for i in (1, 3, 5))
+
 
 class VideoViewer(tk.Canvas):
     """Виджет для отображения видео с камеры"""
@@ -33,71 +37,192 @@ class VideoViewer(tk.Canvas):
         self.configure(bg=DARK_BG, highlightthickness=0)
         self.image_queue = queue.Queue(maxsize=1)
         self.current_image = None
-        self.update_job = None
+        self.image_item = None
+        self.running = False
+        # Новый кадр в очереди, о котором еще не сообщили главному потоку
+        self._frame_ready = threading.Event()
+        self._notifier = None
+        self._frame_lock = threading.Lock()
+        self.canvas_size = (0, 0)
+        # Буфер кадра с полями под размер холста и место кадра в нем
+        self.frame_buffer = None
+        self.frame_rect = None
+        # Раскладка кадра на холсте по размеру кадра, сбрасывается при изменении холста
+        self._layouts = {}
+        self.bind("<Configure>", self._on_configure)
+
+    def _on_configure(self, event):
+        """Пересоздает буфер кадра и PhotoImage под новый размер холста"""
+        if event.width <= 10 or event.height <= 10:
+            return
+        if (event.width, event.height) == self.canvas_size:
+            return
+
+        self.canvas_size = (event.width, event.height)
+        self._layouts = {}
+
+        self.frame_buffer = np.empty((event.height, event.width, 3), dtype=np.uint8)
+        self.frame_buffer[:] = DARK_BG_RGB
+        self.frame_rect = None
+
+        self.current_image = ImageTk.PhotoImage('RGB', (event.width, event.height))
+        self.current_image.paste(self._buffer_image())
+        if self.image_item is None:
+            self.image_item = self.create_image(
+                event.width // 2,
+                event.height // 2,
+                image=self.current_image
+            )
+        else:
+            self.coords(self.image_item, event.width // 2, event.height // 2)
+            self.itemconfigure(self.image_item, image=self.current_image)
+
+    def _buffer_image(self) -> Image.Image:
+        """PIL-изображение с содержимым буфера кадра.
+
+        Для режима RGB frombuffer не отображает память, а копирует ее (как frombytes),
+        и paste в PhotoImage копирует еще раз. Экономия только в том, что буфер
+        с полями заполняется на месте, без отдельных массивов под каждый кадр.
+        """
+        height, width = self.frame_buffer.shape[:2]
+        return Image.frombuffer('RGB', (width, height), self.frame_buffer, 'raw', 'RGB', 0, 1)
+
+    @staticmethod
+    def fit_size(img_width: int, img_height: int,
+                 canvas_width: int, canvas_height: int) -> Tuple[int, int]:
+        """Размер кадра, вписанного в холст с сохранением пропорций"""
+        img_ratio = img_width / img_height
+        canvas_ratio = canvas_width / canvas_height
+
+        if img_ratio > canvas_ratio:
+            return canvas_width, int(canvas_width / img_ratio)
+        return int(canvas_height * img_ratio), canvas_height
+
+    def _layout(self, img_width: int, img_height: int) -> Tuple[Tuple[int, int], int, int, int]:
+        """Размер кадра на холсте, отступы сверху и слева и интерполяция"""
+        canvas_width, canvas_height = self.canvas_size
+        key = (img_width, img_height, canvas_width, canvas_height)
+        layout = self._layouts.get(key)
+        if layout is None:
+            new_width, new_height = self.fit_size(
+                img_width, img_height, canvas_width, canvas_height
+            )
+            interpolation = cv2.INTER_AREA if new_width < img_width else cv2.INTER_LINEAR
+            layout = (
+                (new_width, new_height),
+                (canvas_height - new_height) // 2,
+                (canvas_width - new_width) // 2,
+                interpolation
+            )
+            self._layouts[key] = layout
+        return layout
 
     def start(self):
-        """Запускает обработку очереди кадров"""
-        if not self.update_job:
-            self._process_queue()
+        """Запускает отображение кадров по событию <<NewFrame>>"""
+        if not self.running:
+            self.running = True
+            self.bind("<<NewFrame>>", self._display_latest)
+            if self._notifier is None or not self._notifier.is_alive():
+                self._notifier = threading.Thread(target=self._notify_loop, daemon=True)
+                self._notifier.start()
 
     def stop(self):
-        """Останавливает обработку очереди кадров"""
-        if self.update_job:
-            self.after_cancel(self.update_job)
-            self.update_job = None
+        """Останавливает отображение кадров"""
+        if self.running:
+            self.running = False
+            self.unbind("<<NewFrame>>")
+            self._frame_ready.set()
+
+    def _notify_loop(self):
+        """Сообщает главному потоку о новых кадрах.
+
+        event_generate из другого потока ждет, пока главный цикл примет вызов,
+        поэтому он вынесен сюда: поток захвата и get_frame не зависят от задержек UI.
+        """
+        while True:
+            self._frame_ready.wait()
+            if not self.running:
+                return
+            self._frame_ready.clear()
+            try:
+                self.event_generate("<<NewFrame>>", when="tail")
+            except tk.TclError:
+                # Окно закрыто
+                return
+            except RuntimeError:
+                # Главный цикл еще не запущен, кадр покажется со следующим событием
+                pass
 
-    def update_frame(self, cv_image):
-        """Добавляет новый кадр в очередь"""
-        try:
-            img = Image.fromarray(cv_image)
-            self.image_queue.put_nowait(img)
-        except queue.Full:
-            pass
+    def _queue_frame(self, frame: np.ndarray, layout=None):
+        """Заменяет кадр (BGR) и его раскладку в очереди и будит поток уведомлений"""
+        if not self.running:
+            return
 
-    def _process_queue(self):
-        """Обрабатывает очередь кадров"""
-        try:
-            img = self.image_queue.get_nowait()
-            self._display_image(img)
-        except queue.Empty:
-            pass
+        with self._frame_lock:
+            try:
+                self.image_queue.get_nowait()
+            except queue.Empty:
+                pass
+            self.image_queue.put_nowait((frame, layout, self.canvas_size))
+
+        # Несколько кадров подряд дают одно событие: обработчик возьмет последний
+        self._frame_ready.set()
+
+    def update_bgr_frame(self, frame: np.ndarray):
+        """Уменьшает кадр BGR под размер холста и добавляет в очередь"""
+        if self.frame_buffer is None:
+            self._queue_frame(frame)
+            return
 
-        self.update_job = self.after(33, self._process_queue)  # ~30 FPS
+        img_height, img_width = frame.shape[:2]
+        layout = self._layout(img_width, img_height)
+        size, _, _, interpolation = layout
 
-    def _display_image(self, img: Image.Image):
-        """Отображает изображение на холсте"""
+        # Перевод в RGB выполняется уже на уменьшенном кадре при записи в буфер
+        small = cv2.resize(frame, size, interpolation=interpolation)
+
+        # Раскладка идет вместе с кадром: по размеру уменьшенного кадра ее не восстановить
+        self._queue_frame(small, layout)
+
+    def _display_latest(self, event=None):
+        """Отображает последний кадр из очереди"""
         try:
-            canvas_width = self.winfo_width()
-            canvas_height = self.winfo_height()
+            frame, layout, canvas_size = self.image_queue.get_nowait()
+        except queue.Empty:
+            return
+        # Раскладка устарела, если холст успел измениться
+        if canvas_size != self.canvas_size:
+            layout = None
+        self._display_image(frame, layout)
 
-            if canvas_width <= 10 or canvas_height <= 10:
+    def _display_image(self, frame: np.ndarray, layout=None):
+        """Отображает кадр на холсте"""
+        try:
+            if self.frame_buffer is None:
                 return
 
             # Масштабирование с сохранением пропорций
-            img_ratio = img.width / img.height
-            canvas_ratio = canvas_width / canvas_height
-
-            if img_ratio > canvas_ratio:
-                new_width = canvas_width
-                new_height = int(canvas_width / img_ratio)
-            else:
-                new_height = canvas_height
-                new_width = int(canvas_height * img_ratio)
-
-            img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-
-            # Создание фона
-            bg = Image.new('RGB', (canvas_width, canvas_height), color=DARK_BG)
-            offset = ((canvas_width - new_width) // 2, (canvas_height - new_height) // 2)
-            bg.paste(img, offset)
-
-            # Обновление холста
-            self.current_image = ImageTk.PhotoImage(image=bg)
-            self.create_image(
-                canvas_width // 2,
-                canvas_height // 2,
-                image=self.current_image
+            img_height, img_width = frame.shape[:2]
+            if layout is None:
+                layout = self._layout(img_width, img_height)
+            (new_width, new_height), top, left, interpolation = layout
+
+            # Кадры из update_bgr_frame уже нужного размера
+            if (new_width, new_height) != (img_width, img_height):
+                frame = cv2.resize(frame, (new_width, new_height), interpolation=interpolation)
+
+            # Поля заливаются заново, только если сместилось место кадра
+            rect = (left, top, new_width, new_height)
+            if rect != self.frame_rect:
+                self.frame_buffer[:] = DARK_BG_RGB
+                self.frame_rect = rect
+            # Перевод BGR -> RGB сразу в область кадра внутри буфера, без промежуточной копии
+            cv2.cvtColor(
+                frame, cv2.COLOR_BGR2RGB,
+                dst=self.frame_buffer[top:top + new_height, left:left + new_width]
             )
+
+            self.current_image.paste(self._buffer_image())
         except Exception as e:
             logging.error(f"Display image error: {str(e)}")
 
@@ -127,6 +252,10 @@ class AttendanceSystemUI:
         self.student_id = tk.StringVar()
         self.status_message = tk.StringVar(value="System ready")
 
+        # Число потоков, выводящих на холст размеченные кадры вместо камеры
+        self._annotated_sources = 0
+        self._preview_lock = threading.Lock()
+
         # Настройка интерфейса
         self._setup_ui()
         self._start_video_stream()
@@ -389,15 +518,25 @@ class AttendanceSystemUI:
     def _start_video_stream(self):
         """Запуск потока обновления видео"""
         self.video_viewer.start()
+        # Кадры передаются на холст прямо из потока захвата
+        self.fr_system.camera_manager.start_capture_thread(
+            on_frame=self._on_camera_frame
+        )
+
+    def _on_camera_frame(self, frame: np.ndarray):
+        """Показывает кадр с камеры, если холст не занят размеченными кадрами"""
+        if self._annotated_sources == 0:
+            self.video_viewer.update_bgr_frame(frame)
 
-        def update():
-            ret, frame = self.fr_system.camera_manager.get_frame()
-            if ret:
-                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                self.video_viewer.update_frame(frame)
-            self.root.after(50, update)  # ~20 FPS
+    def _pause_preview(self):
+        """Отключает показ кадров с камеры на время регистрации или сканирования"""
+        with self._preview_lock:
+            self._annotated_sources += 1
 
-        update()
+    def _resume_preview(self):
+        """Возвращает показ кадров с камеры"""
+        with self._preview_lock:
+            self._annotated_sources -= 1
 
     def _switch_camera(self, new_index: int):
         """Переключение на другую камеру"""
@@ -463,13 +602,17 @@ class AttendanceSystemUI:
                     x, y, w, h = kwargs['face_box']
                     cv2.rectangle(frame, (x, y), (x + w, y + h), (255, 0, 0), 2)
 
-                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                self.video_viewer.update_frame(frame)
+                self.video_viewer.update_bgr_frame(frame)
 
             if 'count' in kwargs:
                 self.status_message.set(f"Captured {kwargs['count']} images")
 
-        success, count = self.fr_system.take_images(name, student_id, progress_callback)
+        # Иначе необработанные кадры с камеры чередуются с размеченными, и рамки мигают
+        self._pause_preview()
+        try:
+            success, count = self.fr_system.take_images(name, student_id, progress_callback)
+        finally:
+            self._resume_preview()
 
         if success:
             messagebox.showinfo(
@@ -509,15 +652,18 @@ class AttendanceSystemUI:
 
         def update_callback(**kwargs):
             if 'frame' in kwargs:
-                frame = cv2.cvtColor(kwargs['frame'], cv2.COLOR_BGR2RGB)
-                self.video_viewer.update_frame(frame)
+                self.video_viewer.update_bgr_frame(kwargs['frame'])
 
             if 'status' in kwargs:
                 self.status_message.set(kwargs['status'])
 
             return self.fr_system.is_scanning
 
-        success, message = self.fr_system.track_attendance(update_callback)
+        self._pause_preview()
+        try:
+            success, message = self.fr_system.track_attendance(update_callback)
+        finally:
+            self._resume_preview()
 
         if not success:
             messagebox.showerror("Error", message)
@@ -529,8 +675,7 @@ class AttendanceSystemUI:
 
     def _load_attendance_data(self):
         """Загрузка данных о посещаемости в таблицу"""
-        for item in self.attendance_tree.get_children():
-            self.attendance_tree.delete(item)
+        self.attendance_tree.delete(*self.attendance_tree.get_children())
 
         records = self.fr_system.load_attendance_data()
         for record in records:
@@ -551,7 +696,9 @@ class AttendanceSystemUI:
         """Обработчик закрытия окна"""
         self.fr_system.is_scanning = False
         self.video_viewer.stop()
+        self.fr_system.camera_manager.stop_capture_thread()
         self.fr_system.camera_manager.release()
+        self.fr_system.close()
         self.root.destroy()
 
 
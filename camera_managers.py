@@ -1,6 +1,7 @@
 import cv2
 import numpy as np
-from typing import Tuple, Optional, List
+import threading
+from typing import Tuple, Optional, List, Callable
 import logging
 
 logger = logging.getLogger(__name__)
@@ -12,39 +13,108 @@ class CameraManager:
     def __init__(self, camera_index: int = 0):
         self.camera_index = camera_index
         self.cap = None
+        self._cap_lock = threading.RLock()
+        self._frame_cond = threading.Condition()
+        self._latest_frame = None
+        self._frame_id = 0
+        self._stop_event = threading.Event()
+        self._capture_thread = None
+        self._on_frame = None
+
+    @staticmethod
+    def _probe_camera(index: int) -> Optional[int]:
+        """Проверяет, открывается ли камера с заданным индексом"""
+        cap = cv2.VideoCapture(index, cv2.CAP_DSHOW)
+        try:
+            return index if cap.isOpened() else None
+        finally:
+            cap.release()
 
     @staticmethod
     def get_available_cameras() -> List[int]:
         """Возвращает список доступных камер"""
-        available = []
-        for i in range(3):  # Проверяем первые 3 индекса
-            cap = cv2.VideoCapture(i, cv2.CAP_DSHOW)
-            if cap.isOpened():
-                available.append(i)
-                cap.release()
-        return available
+        # Индексы проверяются по очереди: одновременное открытие нескольких
+        # VideoCapture через DirectShow не гарантированно потокобезопасно
+        indices = range(3)  # Проверяем первые 3 индекса
+        return [i for i in map(CameraManager._probe_camera, indices) if i is not None]
 
     def start_camera(self):
         """Инициализирует камеру"""
-        if self.cap is None or not self.cap.isOpened():
-            self.cap = cv2.VideoCapture(self.camera_index, cv2.CAP_DSHOW)
-            if not self.cap.isOpened():
-                raise RuntimeError(f"Could not open camera {self.camera_index}")
+        with self._cap_lock:
+            if self.cap is None or not self.cap.isOpened():
+                self.cap = cv2.VideoCapture(self.camera_index, cv2.CAP_DSHOW)
+                if not self.cap.isOpened():
+                    raise RuntimeError(f"Could not open camera {self.camera_index}")
+                # Не накапливать устаревшие кадры в буфере драйвера
+                self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+    def start_capture_thread(self, on_frame: Optional[Callable[[np.ndarray], None]] = None):
+        """Запускает фоновый поток захвата кадров; on_frame вызывается для каждого кадра (BGR)"""
+        if self._capture_thread is not None and self._capture_thread.is_alive():
+            return
+
+        self._on_frame = on_frame
+        self.start_camera()
+        self._stop_event.clear()
+        self._capture_thread = threading.Thread(target=self._capture_loop, daemon=True)
+        self._capture_thread.start()
+
+    def stop_capture_thread(self):
+        """Останавливает фоновый поток захвата кадров"""
+        self._stop_event.set()
+        if self._capture_thread is not None:
+            self._capture_thread.join(timeout=1.0)
+            self._capture_thread = None
+
+    def _capture_loop(self):
+        """Цикл захвата кадров в фоновом потоке"""
+        while not self._stop_event.is_set():
+            with self._cap_lock:
+                if self.cap is None:
+                    ret, frame = False, None
+                else:
+                    ret, frame = self.cap.read()
+
+            if not ret:
+                self._stop_event.wait(0.01)
+                continue
+
+            with self._frame_cond:
+                self._latest_frame = frame
+                self._frame_id += 1
+                self._frame_cond.notify_all()
+
+            if self._on_frame is not None:
+                try:
+                    self._on_frame(frame)
+                except Exception as e:
+                    logger.error(f"Frame callback error: {str(e)}")
 
     def get_frame(self) -> Tuple[bool, Optional[np.ndarray]]:
         """Получает кадр с камеры"""
-        if self.cap is None:
-            self.start_camera()
-        return self.cap.read()
+        if self._capture_thread is None:
+            with self._cap_lock:
+                if self.cap is None:
+                    self.start_camera()
+                return self.cap.read()
+
+        # Ждем следующий кадр от потока захвата
+        with self._frame_cond:
+            last_id = self._frame_id
+            if not self._frame_cond.wait_for(lambda: self._frame_id != last_id, timeout=1.0):
+                return False, None
+            return True, self._latest_frame.copy()
 
     def release(self):
         """Освобождает ресурсы камеры"""
-        if self.cap is not None:
-            self.cap.release()
-            self.cap = None
+        with self._cap_lock:
+            if self.cap is not None:
+                self.cap.release()
+                self.cap = None
 
     def switch_camera(self, new_index: int):
         """Переключает на другую камеру"""
-        self.release()
-        self.camera_index = new_index
-        self.start_camera()
\ No newline at end of file
+        with self._cap_lock:
+            self.release()
+            self.camera_index = new_index
+            self.start_camera()
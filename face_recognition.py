@@ -1,4 +1,5 @@
 import os
+import io
 import csv
 import time
 import datetime
@@ -6,12 +7,40 @@ import numpy as np
 import pandas as pd
 import cv2
 import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Tuple, Optional, Callable
-from PIL import Image
 from camera_managers import CameraManager
 
 logger = logging.getLogger(__name__)
 
+# Во сколько раз уменьшается кадр перед поиском лиц
+DETECTION_DOWNSCALE = 2
+# Минимальный размер лица на исходном кадре
+MIN_FACE_SIZE = 100
+# Сторона квадратного изображения лица для обучения и распознавания
+FACE_SIZE = 200
+# Полный поиск и распознавание лиц выполняются раз в столько кадров,
+# между ними рамки ведет трекер
+DETECTION_INTERVAL = 5
+# Кадр считается неизменным, если его хеш 8x8 отличается не более чем на столько бит
+FRAME_HASH_TOLERANCE = 2
+# Даже для неизменного кадра поиск лиц повторяется не реже чем раз в столько секунд
+FRAME_HASH_MAX_AGE = 1.0
+# Модель детектора YuNet (OpenCV Zoo); без нее используется каскад Хаара
+YUNET_MODEL = "face_detection_yunet_2023mar.onnx"
+# Модель эмбеддингов SFace; работает только вместе с YuNet, без них используется LBPH
+SFACE_MODEL = "face_recognition_sface_2021dec.onnx"
+# Порог косинусного сходства SFace для лиц, выровненных alignCrop
+SFACE_THRESHOLD = 0.363
+# Выровненные по ключевым точкам YuNet цветные лица для эмбеддингов SFace
+ALIGNED_DIR = "TrainingImagesAligned"
+# Эмбеддинги обучающих изображений (int8 с масштабом по строкам) и их ID
+EMBEDDINGS_FILE = "Embeddings.npz"
+# Интервал повторной записи посещаемости, если Attendance.csv недоступен (секунды)
+ATTENDANCE_RETRY_INTERVAL = 1.0
+
 
 class FaceRecognitionSystem:
     """Система распознавания лиц для учета посещаемости"""
@@ -19,12 +48,37 @@ class FaceRecognitionSystem:
     def __init__(self, camera_index: int = 0):
         self.camera_manager = CameraManager(camera_index)
         self.is_scanning = False
+        # Кэш модели и списка студентов, перечитываются при изменении файлов
+        self._recognizer = None
+        self._embedder = None
+        self._embeddings = None
+        self._embedding_ids = None
+        self._trainer_mtime = 0
+        self._id_to_name: Dict[int, str] = {}
+        self._known_ids = set()
+        self._details_mtime = 0
         self._setup_directories()
+        self._ensure_details_loaded()
+
+        # Запись посещаемости в отдельном потоке
+        self._attendance_queue = queue.Queue()
+        self._attendance_write_error: Optional[str] = None
+        self._attendance_thread = threading.Thread(
+            target=self._attendance_writer, daemon=True
+        )
+        self._attendance_thread.start()
+
+    def close(self):
+        """Дописывает очередь посещаемости и останавливает поток записи"""
+        self._attendance_queue.put(None)
+        self._attendance_thread.join(timeout=2.0)
 
     def _setup_directories(self):
         """Создание необходимых директорий"""
         os.makedirs("TrainingImages", exist_ok=True)
+        os.makedirs(ALIGNED_DIR, exist_ok=True)
         os.makedirs("ImagesUnknown", exist_ok=True)
+        self._unknown_counter = self._last_unknown_index()
 
         if not os.path.exists("StudentDetails.csv"):
             with open('StudentDetails.csv', 'w', newline='') as f:
@@ -36,15 +90,206 @@ class FaceRecognitionSystem:
                 writer = csv.writer(f)
                 writer.writerow(["ID", "NAME", "DATE", "TIME"])
 
+    @staticmethod
+    def _dnn_backend() -> Tuple[int, int]:
+        """Бэкенд OpenCV DNN: CUDA (FP16) при наличии GPU, иначе CPU"""
+        try:
+            if cv2.cuda.getCudaEnabledDeviceCount() > 0:
+                return cv2.dnn.DNN_BACKEND_CUDA, cv2.dnn.DNN_TARGET_CUDA_FP16
+        except (AttributeError, cv2.error):
+            pass
+        return cv2.dnn.DNN_BACKEND_OPENCV, cv2.dnn.DNN_TARGET_CPU
+
+    @staticmethod
+    def _embeddings_supported() -> bool:
+        """Можно ли использовать SFace: нужны и модель, и YuNet для выравнивания лиц"""
+        return os.path.exists(SFACE_MODEL) and hasattr(cv2, "FaceRecognizerSF") \
+            and os.path.exists(YUNET_MODEL) and hasattr(cv2, "FaceDetectorYN")
+
+    def _create_face_embedder(self):
+        """Создание модели эмбеддингов SFace, если она поддерживается"""
+        if self._embeddings_supported():
+            backend, target = self._dnn_backend()
+            return cv2.FaceRecognizerSF.create(SFACE_MODEL, "", backend, target)
+        return None
+
+    @staticmethod
+    def _face_embedding(embedder, aligned_face: np.ndarray) -> np.ndarray:
+        """Нормированный эмбеддинг лица, выровненного alignCrop"""
+        embedding = embedder.feature(aligned_face).ravel()
+        return embedding / max(float(np.linalg.norm(embedding)), 1e-12)
+
+    def _model_file(self) -> str:
+        """Файл обученной модели: эмбеддинги, если они есть и поддерживаются, иначе LBPH"""
+        if self._embeddings_supported() and os.path.exists(EMBEDDINGS_FILE):
+            return EMBEDDINGS_FILE
+        return "Trainer.yml"
+
+    def _ensure_loaded(self):
+        """Загрузка модели и списка студентов, если файлы изменились"""
+        model_file = self._model_file()
+        trainer_mtime = (model_file, os.stat(model_file).st_mtime_ns)
+        if trainer_mtime != self._trainer_mtime:
+            # LBPH загружается всегда, когда он есть: запасной вариант для эмбеддингов
+            self._recognizer = None
+            if os.path.exists("Trainer.yml"):
+                recognizer = cv2.face.LBPHFaceRecognizer_create()
+                recognizer.read("Trainer.yml")
+                self._recognizer = recognizer
+
+            self._embedder = None
+            if model_file == EMBEDDINGS_FILE:
+                self._embedder = self._create_face_embedder()
+                with np.load(EMBEDDINGS_FILE) as data:
+                    # Деквантование один раз при загрузке: сравнение остается на BLAS (float32)
+                    self._embeddings = data["embeddings"].astype(np.float32) * data["scale"]
+                    self._embedding_ids = data["ids"]
+            self._trainer_mtime = trainer_mtime
+            logger.info(f"Recognition model loaded from {model_file}")
+
+        self._ensure_details_loaded()
+
+    def _ensure_details_loaded(self):
+        """Загрузка списка студентов, если StudentDetails.csv изменился"""
+        details_mtime = os.stat("StudentDetails.csv").st_mtime_ns \
+            if os.path.exists("StudentDetails.csv") else 0
+        if details_mtime == self._details_mtime:
+            return
+
+        id_to_name = {}
+        known_ids = set()
+        if details_mtime:
+            with open('StudentDetails.csv', 'r') as f:
+                reader = csv.reader(f)
+                next(reader, None)
+                for row in reader:
+                    if not row:
+                        continue
+                    known_ids.add(row[0])
+                    if len(row) >= 2 and row[0].isdigit():
+                        id_to_name[int(row[0])] = row[1]
+        self._id_to_name = id_to_name
+        self._known_ids = known_ids
+        self._details_mtime = details_mtime
+
+    @staticmethod
+    def _normalize_face(face: np.ndarray) -> np.ndarray:
+        """Приведение изображения лица к размеру FACE_SIZE x FACE_SIZE"""
+        if face.shape[:2] == (FACE_SIZE, FACE_SIZE):
+            return face
+        interpolation = cv2.INTER_AREA if face.shape[0] > FACE_SIZE else cv2.INTER_LINEAR
+        return cv2.resize(face, (FACE_SIZE, FACE_SIZE), interpolation=interpolation)
+
+    def _predict(
+            self,
+            gray_face: np.ndarray,
+            confidence_threshold: float,
+            frame: Optional[np.ndarray] = None,
+            face_row: Optional[np.ndarray] = None
+    ) -> Tuple[Optional[int], float]:
+        """Распознавание лица: ID студента (None, если не найден) и уверенность"""
+        if self._embedder is not None and face_row is not None:
+            # Одно умножение матрицы на вектор по всем обучающим эмбеддингам
+            aligned = self._embedder.alignCrop(frame, face_row)
+            query = self._face_embedding(self._embedder, aligned)
+            similarities = self._embeddings @ query
+            best = int(similarities.argmax())
+            score = float(similarities[best])
+            if score > SFACE_THRESHOLD:
+                return int(self._embedding_ids[best]), score * 100
+            return None, score * 100
+
+        if self._recognizer is None:
+            return None, 0.0
+
+        id_num, confidence = self._recognizer.predict(self._normalize_face(gray_face))
+        if confidence < confidence_threshold:
+            return id_num, confidence
+        return None, confidence
+
     def student_id_exists(self, student_id: str) -> bool:
         """Проверяет, существует ли студент с заданным ID"""
-        if not os.path.exists("StudentDetails.csv"):
-            return False
+        self._ensure_details_loaded()
+        return student_id in self._known_ids
+
+    def _create_face_detector(self):
+        """Создание детектора лиц: YuNet, если есть модель, иначе каскад Хаара"""
+        if os.path.exists(YUNET_MODEL) and hasattr(cv2, "FaceDetectorYN"):
+            backend, target = self._dnn_backend()
+            return cv2.FaceDetectorYN.create(
+                YUNET_MODEL, "", (320, 320), 0.6, 0.3, 5000, backend, target
+            )
+
+        logger.info(f"{YUNET_MODEL} not found, falling back to Haar cascade")
+        return cv2.CascadeClassifier(
+            cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+        )
 
-        with open('StudentDetails.csv', 'r') as f:
-            reader = csv.reader(f)
-            next(reader)
-            return any(row and row[0] == student_id for row in reader)
+    @staticmethod
+    def _detect_faces(
+            detector, frame: np.ndarray, gray: np.ndarray
+    ) -> List[Tuple[Tuple[int, int, int, int], Optional[np.ndarray]]]:
+        """
+        Поиск лиц на уменьшенном кадре с пересчетом в исходный масштаб.
+        Для каждого лица возвращает рамку и строку YuNet с ключевыми точками
+        (None для каскада Хаара)
+        """
+        min_size = MIN_FACE_SIZE // DETECTION_DOWNSCALE
+
+        if isinstance(detector, cv2.CascadeClassifier):
+            small = cv2.resize(
+                gray, None,
+                fx=1 / DETECTION_DOWNSCALE, fy=1 / DETECTION_DOWNSCALE,
+                interpolation=cv2.INTER_AREA
+            )
+            small = cv2.equalizeHist(small)
+            faces = detector.detectMultiScale(small, 1.1, 5, minSize=(min_size, min_size))
+            return [
+                (tuple(int(v) * DETECTION_DOWNSCALE for v in face), None)
+                for face in faces
+            ]
+
+        small = cv2.resize(
+            frame, None,
+            fx=1 / DETECTION_DOWNSCALE, fy=1 / DETECTION_DOWNSCALE,
+            interpolation=cv2.INTER_AREA
+        )
+        small_h, small_w = small.shape[:2]
+        detector.setInputSize((small_w, small_h))
+        _, faces = detector.detect(small)
+        if faces is None:
+            return []
+
+        # YuNet может вернуть рамку, выходящую за край кадра
+        boxes = []
+        for face in faces:
+            x, y, w, h = (int(v) for v in face[:4])
+            x2, y2 = min(x + w, small_w), min(y + h, small_h)
+            x, y = max(x, 0), max(y, 0)
+            w, h = x2 - x, y2 - y
+            if w < min_size or h < min_size:
+                continue
+            # Рамка и 5 ключевых точек (первые 14 значений) для alignCrop на исходном кадре
+            face_row = face.copy()
+            face_row[:14] *= DETECTION_DOWNSCALE
+            boxes.append(((
+                x * DETECTION_DOWNSCALE, y * DETECTION_DOWNSCALE,
+                w * DETECTION_DOWNSCALE, h * DETECTION_DOWNSCALE
+            ), face_row))
+        return boxes
+
+    @staticmethod
+    def _frame_hash(gray: np.ndarray) -> np.ndarray:
+        """Перцептивный хеш кадра: 64 бита, яркость 8x8 относительно среднего"""
+        small = cv2.resize(gray, (8, 8), interpolation=cv2.INTER_AREA)
+        return (small > small.mean()).ravel()
+
+    @staticmethod
+    def _create_tracker():
+        """Создание легковесного трекера для кадров между поисками лиц"""
+        if hasattr(cv2, "legacy") and hasattr(cv2.legacy, "TrackerMOSSE_create"):
+            return cv2.legacy.TrackerMOSSE_create()
+        return cv2.TrackerKCF_create()
 
     def take_images(
             self,
@@ -56,9 +301,8 @@ class FaceRecognitionSystem:
         Захват изображений для регистрации студента
         """
         try:
-            detector = cv2.CascadeClassifier(
-                cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
-            )
+            detector = self._create_face_detector()
+            embedder = self._create_face_embedder()
             sample_num = 0
             instructions = [
                 "Look straight with neutral face",
@@ -81,15 +325,23 @@ class FaceRecognitionSystem:
                         continue
 
                     gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-                    faces = detector.detectMultiScale(gray, 1.1, 5, minSize=(100, 100))
+                    faces = self._detect_faces(detector, frame, gray)
 
                     if len(faces) == 0:
                         continue
 
-                    for (x, y, w, h) in faces:
+                    # progress_callback рисует рамки на кадре, выравнивание берется с чистой копии
+                    clean_frame = frame.copy() if embedder is not None else frame
+
+                    for (x, y, w, h), face_row in faces:
                         sample_num += 1
                         img_path = f"TrainingImages/{name}.{student_id}.{sample_num}.jpg"
-                        cv2.imwrite(img_path, gray[y:y + h, x:x + w])
+                        cv2.imwrite(img_path, self._normalize_face(gray[y:y + h, x:x + w]))
+                        if embedder is not None and face_row is not None:
+                            cv2.imwrite(
+                                f"{ALIGNED_DIR}/{name}.{student_id}.{sample_num}.jpg",
+                                embedder.alignCrop(clean_frame, face_row)
+                            )
 
                         if progress_callback:
                             progress_callback(
@@ -101,6 +353,7 @@ class FaceRecognitionSystem:
             with open('StudentDetails.csv', 'a', newline='') as f:
                 writer = csv.writer(f)
                 writer.writerow([student_id, name])
+            self._known_ids.add(student_id)
 
             logger.info(f"Registered student {name} with {sample_num} images")
             return True, sample_num
@@ -115,14 +368,17 @@ class FaceRecognitionSystem:
             if not os.path.exists("TrainingImages") or not os.listdir("TrainingImages"):
                 return False, "No training images found"
 
-            recognizer = cv2.face.LBPHFaceRecognizer_create()
             faces, ids = self._get_images_and_labels("TrainingImages")
 
             if len(faces) == 0:
                 return False, "No faces detected in training images"
 
-            recognizer.train(faces, np.array(ids))
+            # LBPH обучается всегда, чтобы распознавание работало и без эмбеддингов
+            recognizer = cv2.face.LBPHFaceRecognizer_create()
+            recognizer.train(list(faces), np.array(ids))
             recognizer.save("Trainer.yml")
+
+            self._train_embeddings(set(ids))
             logger.info("Model trained successfully")
             return True, "Model training completed"
 
@@ -130,24 +386,98 @@ class FaceRecognitionSystem:
             logger.error(f"Model training failed: {str(e)}")
             return False, f"Training error: {str(e)}"
 
-    def _get_images_and_labels(self, path: str) -> Tuple[List[np.ndarray], List[int]]:
-        """Получение изображений и меток из указанной директории"""
-        image_paths = [os.path.join(path, f) for f in os.listdir(path)]
-        faces = []
+    def _train_embeddings(self, student_ids: set):
+        """Эмбеддинги SFace по выровненным лицам; без них для всех студентов остается LBPH"""
+        embedder = self._create_face_embedder()
+        if embedder is None:
+            return
+
+        aligned_faces, aligned_ids = self._get_aligned_faces(ALIGNED_DIR)
+        missing = student_ids - set(aligned_ids)
+        if missing:
+            # Студенты, зарегистрированные без YuNet, не попали бы в эмбеддинги
+            if os.path.exists(EMBEDDINGS_FILE):
+                os.remove(EMBEDDINGS_FILE)
+            logger.info(f"No aligned faces for IDs {sorted(missing)}, using LBPH")
+            return
+
+        embeddings = np.stack([
+            self._face_embedding(embedder, face) for face in aligned_faces
+        ]).astype(np.float32)
+        # Симметричное квантование в int8 с отдельным масштабом для каждой строки
+        scale = np.abs(embeddings).max(axis=1, keepdims=True) / 127.0
+        scale = np.maximum(scale, 1e-12).astype(np.float32)
+        np.savez(
+            EMBEDDINGS_FILE,
+            embeddings=np.round(embeddings / scale).astype(np.int8),
+            scale=scale,
+            ids=np.array(aligned_ids, dtype=np.int64)
+        )
+
+    def _load_face(self, image_path: str) -> Optional[np.ndarray]:
+        """Чтение обучающего изображения; старые снимки произвольного размера приводятся к FACE_SIZE"""
+        img = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+        if img is None:
+            return None
+        return self._normalize_face(img)
+
+    @staticmethod
+    def _list_labeled_images(path: str) -> Tuple[List[str], List[int]]:
+        """Пути к изображениям вида name.id.n.jpg и ID студентов из имен файлов"""
+        image_paths = []
         ids = []
 
-        for image_path in image_paths:
-            try:
-                img = Image.open(image_path).convert('L')
-                img_np = np.array(img, 'uint8')
-                id_num = int(os.path.split(image_path)[-1].split(".")[1])
-                faces.append(img_np)
-                ids.append(id_num)
-            except Exception as e:
-                logger.warning(f"Error processing {image_path}: {str(e)}")
-                continue
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                try:
+                    ids.append(int(entry.name.split(".", 2)[1]))
+                    image_paths.append(entry.path)
+                except (IndexError, ValueError):
+                    logger.warning(f"Skipping {entry.name}: no student ID in file name")
+
+        return image_paths, ids
+
+    @staticmethod
+    def _read_labeled_images(
+            image_paths: List[str],
+            ids: List[int],
+            loader: Callable[[str], Optional[np.ndarray]]
+    ):
+        """Загружает изображения функцией loader и выдает пары (изображение, ID), пропуская нечитаемые"""
+        # cv2.imread отпускает GIL, поэтому декодирование идет параллельно
+        with ThreadPoolExecutor() as executor:
+            images = executor.map(loader, image_paths)
+            for image_path, img, id_num in zip(image_paths, images, ids):
+                if img is None:
+                    logger.warning(f"Error processing {image_path}: could not read image")
+                    continue
+                yield img, id_num
+
+    def _get_aligned_faces(self, path: str) -> Tuple[List[np.ndarray], List[int]]:
+        """Получение выровненных цветных лиц и меток из указанной директории"""
+        image_paths, ids = self._list_labeled_images(path)
+
+        faces = []
+        labels = []
+        for img, id_num in self._read_labeled_images(image_paths, ids, cv2.imread):
+            faces.append(img)
+            labels.append(id_num)
+
+        return faces, labels
+
+    def _get_images_and_labels(self, path: str) -> Tuple[np.ndarray, List[int]]:
+        """Получение изображений и меток из указанной директории"""
+        image_paths, ids = self._list_labeled_images(path)
 
-        return faces, ids
+        faces = np.empty((len(image_paths), FACE_SIZE, FACE_SIZE), dtype=np.uint8)
+        labels = []
+        for img_np, id_num in self._read_labeled_images(image_paths, ids, self._load_face):
+            faces[len(labels)] = img_np
+            labels.append(id_num)
+
+        return faces[:len(labels)], labels
 
     def track_attendance(
             self,
@@ -158,61 +488,98 @@ class FaceRecognitionSystem:
         Отслеживание посещаемости в реальном времени
         """
         try:
-            if not os.path.exists("Trainer.yml"):
+            if not os.path.exists(self._model_file()):
                 return False, "Model not trained"
 
-            recognizer = cv2.face.LBPHFaceRecognizer_create()
-            recognizer.read("Trainer.yml")
+            self._ensure_loaded()
+            id_to_name = self._id_to_name
 
-            face_cascade = cv2.CascadeClassifier(
-                cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
-            )
-
-            try:
-                df = pd.read_csv("StudentDetails.csv")
-            except:
-                df = pd.DataFrame(columns=["ID", "NAME"])
+            detector = self._create_face_detector()
 
             font = cv2.FONT_HERSHEY_SIMPLEX
             recognized_ids = set()
+            frame_idx = 0
+            tracks = []  # [трекер, подпись, цвет] для каждого найденного лица
+            last_hash = None
+            last_detect = 0.0
+            reported_error = None
 
             while self.is_scanning:
                 ret, frame = self.camera_manager.get_frame()
                 if not ret:
                     continue
 
-                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-                faces = face_cascade.detectMultiScale(gray, 1.1, 5, minSize=(100, 100))
+                annotations = []
+                run_detection = frame_idx % DETECTION_INTERVAL == 0
+                if run_detection:
+                    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
 
-                for (x, y, w, h) in faces:
-                    cv2.rectangle(frame, (x, y), (x + w, y + h), (255, 0, 0), 2)
-                    id_num, confidence = recognizer.predict(gray[y:y + h, x:x + w])
-
-                    if confidence < confidence_threshold:
-                        student_name = df.loc[df['ID'] == id_num, 'NAME'].values[0] \
-                            if id_num in df['ID'].values else "Unknown"
-
-                        if id_num not in recognized_ids:
-                            self._record_attendance(id_num, student_name)
-                            recognized_ids.add(id_num)
-                            if update_callback:
-                                update_callback(
-                                    status=f"Recognized: {student_name} (ID: {id_num})",
-                                    recognized=True
-                                )
-
-                        label = f"{student_name} ({confidence:.1f}%)"
-                        color = (0, 255, 0)
+                    # Неизменный кадр: поиск и распознавание не повторяются, рамки ведет трекер
+                    frame_hash = self._frame_hash(gray)
+                    now = time.monotonic()
+                    if last_hash is not None \
+                            and np.count_nonzero(frame_hash != last_hash) <= FRAME_HASH_TOLERANCE \
+                            and now - last_detect < FRAME_HASH_MAX_AGE:
+                        run_detection = False
                     else:
-                        label = "Unknown"
-                        color = (0, 0, 255)
-                        self._save_unknown_face(gray[y:y + h, x:x + w])
-
+                        last_hash = frame_hash
+                        last_detect = now
+
+                if run_detection:
+                    faces = self._detect_faces(detector, frame, gray)
+                    tracks = []
+
+                    for (x, y, w, h), face_row in faces:
+                        id_num, confidence = self._predict(
+                            gray[y:y + h, x:x + w], confidence_threshold,
+                            frame, face_row
+                        )
+
+                        if id_num is not None:
+                            student_name = id_to_name.get(id_num, "Unknown")
+
+                            if id_num not in recognized_ids:
+                                self._record_attendance(id_num, student_name)
+                                recognized_ids.add(id_num)
+                                if update_callback:
+                                    update_callback(
+                                        status=f"Recognized: {student_name} (ID: {id_num})",
+                                        recognized=True
+                                    )
+
+                            label = f"{student_name} ({confidence:.1f}%)"
+                            color = (0, 255, 0)
+                        else:
+                            label = "Unknown"
+                            color = (0, 0, 255)
+                            self._save_unknown_face(gray[y:y + h, x:x + w])
+
+                        tracker = self._create_tracker()
+                        tracker.init(frame, (x, y, w, h))
+                        tracks.append((tracker, label, color))
+                        annotations.append(((x, y, w, h), label, color))
+                else:
+                    # Между поисками только сдвигаем рамки, без распознавания
+                    for tracker, label, color in tracks:
+                        ok, box = tracker.update(frame)
+                        if ok:
+                            annotations.append((tuple(int(v) for v in box), label, color))
+
+                frame_idx += 1
+
+                for (x, y, w, h), label, color in annotations:
+                    cv2.rectangle(frame, (x, y), (x + w, y + h), (255, 0, 0), 2)
                     cv2.putText(
                         frame, label, (x, y + h + 30),
                         font, 0.8, color, 2
                     )
 
+                # Сообщить о недоступном Attendance.csv: строки ждут повторной записи
+                write_error = self._attendance_write_error
+                if write_error and write_error != reported_error and update_callback:
+                    update_callback(status=write_error)
+                reported_error = write_error
+
                 if update_callback and not update_callback(frame=frame):
                     break
 
@@ -228,15 +595,80 @@ class FaceRecognitionSystem:
         date = datetime.datetime.fromtimestamp(ts).strftime('%d-%m-%Y')
         time_str = datetime.datetime.fromtimestamp(ts).strftime('%H:%M:%S')
 
-        with open('Attendance.csv', 'a', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow([student_id, name, date, time_str])
-        logger.info(f"Attendance recorded for {name} (ID: {student_id})")
+        self._attendance_queue.put_nowait([student_id, name, date, time_str])
+
+    def _attendance_writer(self):
+        """Поток записи посещаемости: строки из очереди дописываются пачками"""
+        pending = []
+        running = True
+        while running:
+            # Пока есть незаписанные строки, запись повторяется периодически
+            try:
+                items = [self._attendance_queue.get(
+                    timeout=ATTENDANCE_RETRY_INTERVAL if pending else None
+                )]
+            except queue.Empty:
+                items = []
+            while True:
+                try:
+                    items.append(self._attendance_queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            for item in items:
+                if item is None:
+                    running = False
+                else:
+                    pending.append(item)
+
+            try:
+                if pending:
+                    pending = self._write_attendance_rows(pending)
+            except Exception as e:
+                # Любая ошибка пачки не должна останавливать поток: строки ждут повтора
+                self._attendance_write_error = f"Failed to write attendance: {str(e)}"
+                logger.exception(self._attendance_write_error)
+            finally:
+                for _ in items:
+                    self._attendance_queue.task_done()
+
+        if pending:
+            logger.error(f"{len(pending)} attendance records were not written to Attendance.csv")
+
+    def _write_attendance_rows(self, rows: List[List[str]]) -> List[List[str]]:
+        """Дописывает строки в Attendance.csv; возвращает строки, которые записать не удалось"""
+        # Строки форматируются заранее, чтобы ошибка в данных не оставила в файле полпачки
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        try:
+            # Файл открывается на каждую пачку: его может заблокировать, например, Excel
+            with open('Attendance.csv', 'a', newline='') as f:
+                f.write(buffer.getvalue())
+        except OSError as e:
+            self._attendance_write_error = f"Failed to write attendance: {str(e)}"
+            logger.error(self._attendance_write_error)
+            return rows
+
+        self._attendance_write_error = None
+        for student_id, name, _, _ in rows:
+            logger.info(f"Attendance recorded for {name} (ID: {student_id})")
+        return []
+
+    @staticmethod
+    def _last_unknown_index() -> int:
+        """Наибольший номер среди сохраненных неизвестных лиц"""
+        last = 0
+        with os.scandir("ImagesUnknown") as entries:
+            for entry in entries:
+                stem = os.path.splitext(entry.name)[0]
+                if stem.startswith("Unknown_") and stem[8:].isdigit():
+                    last = max(last, int(stem[8:]))
+        return last
 
     def _save_unknown_face(self, face_img: np.ndarray):
         """Сохранение изображения неизвестного лица"""
-        unknown_count = len(os.listdir("ImagesUnknown"))
-        cv2.imwrite(f"ImagesUnknown/Unknown_{unknown_count + 1}.jpg", face_img)
+        self._unknown_counter += 1
+        cv2.imwrite(f"ImagesUnknown/Unknown_{self._unknown_counter}.jpg", face_img)
         logger.debug("Saved unknown face image")
 
     def load_attendance_data(self) -> List[Dict[str, str]]:
@@ -245,17 +677,24 @@ class FaceRecognitionSystem:
             if not os.path.exists("Attendance.csv"):
                 return []
 
-            df = pd.read_csv("Attendance.csv")
+            # Дождаться записи всех отметок из очереди
+            if self._attendance_thread.is_alive():
+                self._attendance_queue.join()
+
+            df = pd.read_csv(
+                "Attendance.csv",
+                usecols=["ID", "NAME", "DATE", "TIME"],
+                dtype=str
+            )
             if df.empty:
                 return []
 
+            # Дата и время разбираются отдельно, без склейки строк по каждой записи
             df['DATETIME'] = pd.to_datetime(
-                df['DATE'] + ' ' + df['TIME'],
-                format='%d-%m-%Y %H:%M:%S',
-                errors='coerce'
-            )
-            return df.sort_values('DATETIME', ascending=False) \
-                .dropna() \
+                df['DATE'], format='%d-%m-%Y', errors='coerce', cache=True
+            ) + pd.to_timedelta(df['TIME'], errors='coerce')
+            return df.dropna() \
+                .sort_values('DATETIME', ascending=False, kind='stable') \
                 .to_dict('records')
 
         except Exception as e: